@@ -0,0 +1,564 @@
+"""End-to-end benchmark for the video analysis server, on synthetic footage.
+
+Generates mp4s and live sources with ffmpeg's testsrc/sine, serves the live ones
+through a local stand-in camera, starts the server with the stub analyzer and
+drives /api/streams, /ws/chunks, /chunks, /ask*, /stream, /api/alerts and
+/api/tasks against it. Each phase reports endpoint latency percentiles, chunks
+per second, CPU seconds per minute of footage and peak RSS of the server's
+process tree (read from /proc, so Linux only).
+
+    python bench.py run --out bench_results/main.json
+    python bench.py compare bench_results/main.json bench_results/branch.json
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional
+
+SERVER_DIR = os.path.dirname(os.path.abspath(__file__))
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+
+# Synthetic footage
+def picture(size: str, rate: int, seconds: Optional[float] = None) -> str:
+    """testsrc2 with light sensor noise, so it compresses like camera footage rather than a flat card"""
+    duration = f":duration={seconds}" if seconds else ""
+    return f"testsrc2=size={size}:rate={rate}{duration},noise=alls=3:allf=t"
+
+def make_video(path: str, seconds: float, size: str = "640x360", rate: int = 25, tone: int = 440):
+    """Synthetic picture with a sine tone, keyframe every second"""
+    subprocess.run([
+        'ffmpeg', '-v', 'error', '-y',
+        '-f', 'lavfi', '-i', picture(size, rate, seconds),
+        '-f', 'lavfi', '-i', f"sine=frequency={tone}:duration={seconds}",
+        '-c:v', 'libx264', '-preset', 'ultrafast', '-g', str(rate), '-pix_fmt', 'yuv420p',
+        '-c:a', 'aac', '-shortest', path
+    ], check=True)
+
+
+class FakeCamera:
+    """Stand-in for an RTSP camera: a live-paced synthetic feed for every TCP client.
+
+    The server reads it like any other source URL (tcp://127.0.0.1:<port>). Each
+    connection gets its own encode, so a client joining late still starts on a
+    container header; the encodes run in this process, outside the measured tree.
+    """
+
+    def __init__(self, size: str = "640x360", rate: int = 25, tone: int = 440):
+        self.server = socket.create_server(("127.0.0.1", 0))
+        self.url = f"tcp://127.0.0.1:{self.server.getsockname()[1]}"
+        self.cmd = [
+            'ffmpeg', '-v', 'error', '-re',
+            '-f', 'lavfi', '-i', picture(size, rate),
+            '-f', 'lavfi', '-i', f"sine=frequency={tone}",
+            '-c:v', 'libx264', '-preset', 'ultrafast', '-tune', 'zerolatency', '-g', str(rate),
+            '-pix_fmt', 'yuv420p', '-c:a', 'aac', '-f', 'matroska', 'pipe:1'
+        ]
+        self.feeds: List[tuple] = []
+        self.running = True
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while self.running:
+            try:
+                client, _ = self.server.accept()
+            except OSError:
+                return
+            process = subprocess.Popen(self.cmd, stdout=client.fileno(), stderr=subprocess.DEVNULL)
+            self.feeds.append((client, process))
+
+    def stop(self):
+        self.running = False
+        self.server.close()
+        for client, process in self.feeds:
+            process.kill()
+            process.wait()
+            client.close()
+
+
+# Process tree sampling
+def _children(pid: int) -> List[int]:
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            return [int(child) for child in f.read().split()]
+    except OSError:
+        return []
+
+def process_tree(pid: int) -> List[int]:
+    pids, pending = [], [pid]
+    while pending:
+        current = pending.pop()
+        pids.append(current)
+        pending.extend(_children(current))
+    return pids
+
+def tree_cpu_seconds(pid: int) -> float:
+    """CPU time of the process tree, including children it has already reaped"""
+    total = 0
+    for current in process_tree(pid):
+        try:
+            with open(f"/proc/{current}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        # utime, stime, cutime, cstime (fields 14-17, counted after the command name)
+        total += sum(int(value) for value in fields[11:15])
+    return total / CLOCK_TICKS
+
+def tree_rss_bytes(pid: int) -> int:
+    total = 0
+    for current in process_tree(pid):
+        try:
+            with open(f"/proc/{current}/statm") as f:
+                total += int(f.read().split()[1]) * PAGE_SIZE
+        except OSError:
+            continue
+    return total
+
+def peak_rss_bytes(pid: int) -> Optional[int]:
+    """High-water RSS of the server process itself since it started"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+class Phase:
+    """Measures one component's share of the run: wall time, CPU, peak tree RSS and chunks"""
+
+    def __init__(self, name: str, pid: int, interval: float = 0.2):
+        self.name = name
+        self.pid = pid
+        self.interval = interval
+        self.peak_rss = 0
+        self.chunks = 0
+        self.footage_seconds = 0.0
+        self._stop = threading.Event()
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak_rss = max(self.peak_rss, tree_rss_bytes(self.pid))
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        self.cpu_start = tree_cpu_seconds(self.pid)
+        self.peak_rss = tree_rss_bytes(self.pid)
+        self._sampler = threading.Thread(target=self._sample, daemon=True)
+        self._sampler.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.wall = time.perf_counter() - self.started
+        self.cpu = tree_cpu_seconds(self.pid) - self.cpu_start
+        self._stop.set()
+        self._sampler.join()
+
+    def report(self) -> dict:
+        minutes = self.footage_seconds / 60
+        return {
+            "wall_seconds": round(self.wall, 3),
+            "cpu_seconds": round(self.cpu, 3),
+            "footage_minutes": round(minutes, 3),
+            "cpu_seconds_per_footage_minute": round(self.cpu / minutes, 3) if minutes else None,
+            "chunks": self.chunks,
+            "chunks_per_second": round(self.chunks / self.wall, 3) if self.wall else None,
+            "peak_rss_mb": round(self.peak_rss / (1024 * 1024), 1)
+        }
+
+
+# HTTP driving
+class Recorder:
+    """Latency samples per endpoint"""
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+        self.lock = threading.Lock()
+
+    def add(self, endpoint: str, seconds: float, ok: bool):
+        with self.lock:
+            self.samples.setdefault(endpoint, []).append(seconds)
+            if not ok:
+                self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+    @staticmethod
+    def percentile(values: List[float], q: float) -> float:
+        ordered = sorted(values)
+        rank = q * (len(ordered) - 1)
+        low = int(rank)
+        high = min(low + 1, len(ordered) - 1)
+        return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+    def report(self) -> dict:
+        report = {}
+        for endpoint, values in sorted(self.samples.items()):
+            report[endpoint] = {
+                "count": len(values),
+                "errors": self.errors.get(endpoint, 0),
+                "mean_ms": round(1000 * sum(values) / len(values), 2),
+                "p50_ms": round(1000 * self.percentile(values, 0.50), 2),
+                "p95_ms": round(1000 * self.percentile(values, 0.95), 2),
+                "p99_ms": round(1000 * self.percentile(values, 0.99), 2),
+                "max_ms": round(1000 * max(values), 2)
+            }
+        return report
+
+
+class Client:
+    def __init__(self, base_url: str, recorder: Recorder):
+        self.base_url = base_url
+        self.recorder = recorder
+
+    def call(self, method: str, path: str, label: Optional[str] = None, body: Optional[dict] = None,
+             params: Optional[dict] = None, timeout: float = 120) -> Optional[dict]:
+        url = self.base_url + path
+        if params:
+            url += "?" + urllib.parse.urlencode(params)
+        data = json.dumps(body).encode() if body is not None else None
+        request = urllib.request.Request(url, data=data, method=method,
+                                         headers={"Content-Type": "application/json"} if data else {})
+        started = time.perf_counter()
+        ok, payload = False, None
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                payload = json.loads(response.read() or b"null")
+                ok = True
+        except (urllib.error.URLError, OSError, ValueError) as e:
+            print(f"  {method} {path}: {e}", file=sys.stderr)
+        if label:
+            self.recorder.add(label, time.perf_counter() - started, ok)
+        return payload
+
+    def stream(self, stream: str, seconds: float) -> int:
+        """Read /stream for a while; records time to first byte and returns bytes received"""
+        url = f"{self.base_url}/stream?stream={urllib.parse.quote(stream)}"
+        started = time.perf_counter()
+        received = 0
+        try:
+            with urllib.request.urlopen(url, timeout=30) as response:
+                first = response.read1(64 * 1024)
+                self.recorder.add("GET /stream (first byte)", time.perf_counter() - started, bool(first))
+                received = len(first)
+                while first and time.perf_counter() - started < seconds:
+                    chunk = response.read1(64 * 1024)
+                    if not chunk:
+                        break
+                    received += len(chunk)
+        except (urllib.error.URLError, OSError) as e:
+            self.recorder.add("GET /stream (first byte)", time.perf_counter() - started, False)
+            print(f"  GET /stream: {e}", file=sys.stderr)
+        return received
+
+
+class ChunkListener:
+    """Counts new_chunk notifications from /ws/chunks, with their delivery times"""
+
+    def __init__(self, ws_url: str):
+        from websockets.sync.client import connect
+        self.connection = connect(ws_url)
+        self.chunks: List[dict] = []
+        self.messages = 0
+        threading.Thread(target=self._listen, daemon=True).start()
+
+    def _listen(self):
+        try:
+            for raw in self.connection:
+                message = json.loads(raw)
+                self.messages += 1
+                if message.get("type") == "new_chunk":
+                    self.chunks.append({**message["data"], "received": time.time()})
+        except Exception:
+            pass
+
+    def close(self):
+        self.connection.close()
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def start_server(work_dir: str, port: int, args) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "ANALYZER_BACKEND": "stub",
+        "STUB_LATENCY_SECONDS": str(args.stub_latency),
+        "STUB_DETECTION_RATE": str(args.stub_detection_rate),
+        "HLS_ENABLED": "1" if args.hls else "0",
+        "PYTHONUNBUFFERED": "1"
+    }
+    log = open(os.path.join(work_dir, "server.log"), "w")
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--app-dir", SERVER_DIR,
+         "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=work_dir, env=env, stdout=log, stderr=subprocess.STDOUT
+    )
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with {process.returncode}, see {log.name}")
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/", timeout=2).read()
+            return process
+        except (urllib.error.URLError, OSError):
+            time.sleep(0.3)
+    process.kill()
+    raise RuntimeError("Server did not come up within 60s")
+
+
+# Phases
+def bench_capture(client: Client, listener: ChunkListener, pid: int, args, phases: dict) -> List[str]:
+    """RTSPStreamHandler: record live sources into chunks"""
+    cameras = [FakeCamera(tone=440 + 110 * i) for i in range(args.sources)]
+    names = [f"bench{i}" for i in range(args.sources)]
+    with Phase("RTSPStreamHandler", pid) as phase:
+        for name, camera in zip(names, cameras):
+            client.call("POST", "/api/streams", "POST /api/streams", body={
+                "name": name, "url": camera.url, "chunk_duration": args.chunk_seconds,
+                "max_chunks": 1000, "enabled": True
+            })
+        time.sleep(args.capture_seconds)
+        for name in names:
+            client.call("POST", f"/api/streams/{name}/stop", "POST /api/streams/{name}/stop")
+        time.sleep(1)  # Let the last segments land
+    phase.chunks = sum(1 for chunk in listener.chunks if chunk.get("stream") in names)
+    phase.footage_seconds = args.sources * args.capture_seconds
+    phases[phase.name] = phase.report()
+    phases[phase.name]["ws_messages"] = listener.messages
+    for camera in cameras:
+        camera.stop()
+    return names
+
+
+def bench_chunks(client: Client, streams: List[str], pid: int, args, phases: dict):
+    """ChunkManager: chunk lookups and exact-range clips"""
+    with Phase("ChunkManager", pid) as phase, ThreadPoolExecutor(args.concurrency) as pool:
+        jobs = []
+        for i in range(args.ask_requests):
+            stream = streams[i % len(streams)]
+            jobs.append(pool.submit(client.call, "GET", "/chunks", "GET /chunks", params={"stream": stream}))
+            jobs.append(pool.submit(client.call, "POST", "/ask/video", "POST /ask/video (range)", body={
+                "question": "What is on screen?", "stream": stream,
+                "last_seconds": min(args.chunk_seconds * 1.5, args.capture_seconds)
+            }))
+        clips = [job.result() for job in jobs]
+    phase.chunks = sum(1 for clip in clips if clip and "video" in clip)
+    phase.footage_seconds = phase.chunks * min(args.chunk_seconds * 1.5, args.capture_seconds)
+    phases[phase.name] = phase.report()
+
+
+def bench_ask(client: Client, streams: List[str], pid: int, args, phases: dict):
+    """VideoProcessor: screenshot extraction behind every /ask mode"""
+    endpoints = [("/ask/image", "What color is the background?"),
+                 ("/ask/audio", "What sound can you hear?"),
+                 ("/ask", "What is happening?")]
+    with Phase("VideoProcessor", pid) as phase, ThreadPoolExecutor(args.concurrency) as pool:
+        jobs = []
+        for i in range(args.ask_requests):
+            path, question = endpoints[i % len(endpoints)]
+            jobs.append(pool.submit(client.call, "POST", path, f"POST {path}", body={
+                "question": f"{question} ({i})", "stream": streams[i % len(streams)], "time": "last"
+            }))
+        answers = [job.result() for job in jobs]
+    phase.chunks = sum(1 for answer in answers if answer)
+    phase.footage_seconds = phase.chunks * args.chunk_seconds
+    phases[phase.name] = phase.report()
+
+
+def bench_live(client: Client, pid: int, args, phases: dict):
+    """/stream: clients sharing one live ingest"""
+    camera = FakeCamera()
+    client.call("POST", "/api/streams", body={"name": "benchlive", "url": camera.url, "enabled": False})
+    with Phase("LiveStream", pid) as phase, ThreadPoolExecutor(args.stream_clients) as pool:
+        received = list(pool.map(lambda _: client.stream("benchlive", args.stream_seconds),
+                                 range(args.stream_clients)))
+    phase.footage_seconds = args.stream_seconds
+    phases[phase.name] = phase.report()
+    phases[phase.name]["mb_per_client"] = round(sum(received) / max(1, len(received)) / (1024 * 1024), 2)
+    camera.stop()
+
+
+def bench_alerts(client: Client, work_dir: str, pid: int, args, phases: dict):
+    """AlertManager: alerts over recorded videos, polled through /api/tasks"""
+    video_ids = []
+    for i in range(args.videos):
+        video_id = f"bench_{i}"
+        make_video(os.path.join(work_dir, "server", f"{video_id}.mp4"), args.video_seconds, tone=330 + 55 * i)
+        video_ids.append(video_id)
+
+    with Phase("AlertManager", pid) as phase:
+        for video_id in video_ids:
+            for j in range(args.alerts_per_video):
+                client.call("POST", "/api/alerts", "POST /api/alerts", params={
+                    "video_id": video_id, "alert_description": f"condition {j}",
+                    "interval_seconds": args.alert_interval
+                })
+        deadline = time.time() + args.alert_timeout
+        pending = set(video_ids)
+        while pending and time.time() < deadline:
+            for video_id in list(pending):
+                tasks = client.call("GET", "/api/tasks", "GET /api/tasks", params={"video_id": video_id})
+                if tasks and all(task["is_completed"] for task in tasks["tasks"]):
+                    phase.chunks += sum(task["detection_count"] for task in tasks["tasks"])
+                    pending.discard(video_id)
+            time.sleep(0.5)
+    if pending:
+        print(f"  Alerts on {sorted(pending)} did not finish within {args.alert_timeout}s", file=sys.stderr)
+    phase.footage_seconds = (len(video_ids) - len(pending)) * args.video_seconds * args.alerts_per_video
+    phases[phase.name] = phase.report()
+
+
+def git_version() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], cwd=SERVER_DIR,
+                              capture_output=True, text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+
+
+def run(args) -> dict:
+    work_dir = tempfile.mkdtemp(prefix="bench_")
+    os.makedirs(os.path.join(work_dir, "server"))
+    port = free_port()
+    recorder = Recorder()
+    client = Client(f"http://127.0.0.1:{port}", recorder)
+    phases: Dict[str, dict] = {}
+    server = start_server(work_dir, port, args)
+    listener = None
+    try:
+        listener = ChunkListener(f"ws://127.0.0.1:{port}/ws/chunks")
+        print("▶ capture")
+        streams = bench_capture(client, listener, server.pid, args, phases)
+        print("▶ chunks")
+        bench_chunks(client, streams, server.pid, args, phases)
+        print("▶ ask")
+        bench_ask(client, streams, server.pid, args, phases)
+        print("▶ live stream")
+        bench_live(client, server.pid, args, phases)
+        print("▶ alerts")
+        bench_alerts(client, work_dir, server.pid, args, phases)
+        status = client.call("GET", "/status")
+        peak = peak_rss_bytes(server.pid)
+    finally:
+        if listener:
+            listener.close()
+        server.terminate()
+        try:
+            server.wait(timeout=20)
+        except subprocess.TimeoutExpired:
+            server.kill()
+        if not args.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    return {
+        "version": git_version(),
+        "created_at": datetime.now().isoformat(),
+        "settings": {key: value for key, value in vars(args).items() if key not in ("command", "func")},
+        "environment": {"python": platform.python_version(), "platform": platform.platform(),
+                        "cpus": os.cpu_count()},
+        "endpoints": recorder.report(),
+        "components": phases,
+        "server": {"peak_rss_mb": round(peak / (1024 * 1024), 1) if peak else None, "status": status},
+        "work_dir": work_dir if args.keep else None
+    }
+
+
+# Comparison
+LOWER_IS_BETTER = ("p50_ms", "p95_ms", "p99_ms", "cpu_seconds_per_footage_minute", "peak_rss_mb")
+HIGHER_IS_BETTER = ("chunks_per_second",)
+
+def compare(base: dict, new: dict, threshold: float) -> List[str]:
+    """Print every metric's change; returns the regressions beyond the threshold"""
+    regressions = []
+    print(f"{base.get('version')} -> {new.get('version')}")
+    for section in ("endpoints", "components"):
+        for name, metrics in new.get(section, {}).items():
+            old_metrics = base.get(section, {}).get(name)
+            if not old_metrics:
+                continue
+            for metric in LOWER_IS_BETTER + HIGHER_IS_BETTER:
+                old, current = old_metrics.get(metric), metrics.get(metric)
+                if not old or current is None:
+                    continue
+                change = (current - old) / old
+                worse = change if metric in LOWER_IS_BETTER else -change
+                flag = "  REGRESSION" if worse > threshold else ""
+                line = f"{name:<38} {metric:<32} {old:>10} -> {current:<10} {change:+.1%}{flag}"
+                print(line)
+                if flag:
+                    regressions.append(line)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Run the benchmark and write a JSON report")
+    run_parser.add_argument("--out", default=os.path.join("bench_results", f"bench_{datetime.now():%Y%m%d_%H%M%S}.json"))
+    run_parser.add_argument("--sources", type=int, default=2, help="Simulated cameras recorded at once")
+    run_parser.add_argument("--capture-seconds", type=float, default=40)
+    run_parser.add_argument("--chunk-seconds", type=int, default=10)
+    run_parser.add_argument("--ask-requests", type=int, default=30)
+    run_parser.add_argument("--concurrency", type=int, default=8)
+    run_parser.add_argument("--stream-clients", type=int, default=4)
+    run_parser.add_argument("--stream-seconds", type=float, default=8)
+    run_parser.add_argument("--videos", type=int, default=3)
+    run_parser.add_argument("--video-seconds", type=float, default=60)
+    run_parser.add_argument("--alerts-per-video", type=int, default=2)
+    run_parser.add_argument("--alert-interval", type=int, default=10)
+    run_parser.add_argument("--alert-timeout", type=float, default=300)
+    run_parser.add_argument("--stub-latency", type=float, default=0.2)
+    run_parser.add_argument("--stub-detection-rate", type=float, default=0.1)
+    run_parser.add_argument("--no-hls", dest="hls", action="store_false",
+                            help="Capture without the HLS tee (the server records HLS by default)")
+    run_parser.add_argument("--keep", action="store_true", help="Keep the work directory")
+
+    compare_parser = commands.add_parser("compare", help="Compare two reports; exits 1 on regressions")
+    compare_parser.add_argument("base")
+    compare_parser.add_argument("new")
+    compare_parser.add_argument("--threshold", type=float, default=0.10)
+
+    args = parser.parse_args()
+    if args.command == "compare":
+        with open(args.base) as f:
+            base = json.load(f)
+        with open(args.new) as f:
+            new = json.load(f)
+        regressions = compare(base, new, args.threshold)
+        print(f"{len(regressions)} regression(s) beyond {args.threshold:.0%}")
+        sys.exit(1 if regressions else 0)
+
+    report = run(args)
+    if os.path.dirname(args.out):
+        os.makedirs(os.path.dirname(args.out), exist_ok=True)
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    for name, metrics in report["components"].items():
+        print(f"{name:<20} {json.dumps(metrics)}")
+    for name, metrics in report["endpoints"].items():
+        print(f"{name:<34} p50 {metrics['p50_ms']}ms  p95 {metrics['p95_ms']}ms  p99 {metrics['p99_ms']}ms  ({metrics['count']})")
+    print(f"Report written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
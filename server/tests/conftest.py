@@ -0,0 +1,30 @@
+"""Import the server from a scratch directory so its databases and media folders stay out of the tree"""
+import os
+import sys
+import tempfile
+from datetime import datetime
+
+import pytest
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORK_DIR = tempfile.mkdtemp(prefix="server-tests-")
+
+os.environ.setdefault("ANALYZER_BACKEND", "stub")
+os.environ.setdefault("STUB_LATENCY_SECONDS", "0")
+os.environ.setdefault("HLS_ENABLED", "0")
+os.chdir(WORK_DIR)
+os.makedirs("server", exist_ok=True)
+sys.path.insert(0, SERVER_DIR)
+
+
+def chunk_name(timestamp: float) -> str:
+    """File name the recorder gives a chunk starting at `timestamp`"""
+    return datetime.fromtimestamp(timestamp).strftime('%Y%m%d_%H%M%S') + ".mp4"
+
+
+@pytest.fixture
+def media_file(tmp_path):
+    """A small file with fixed content, standing in for a chunk"""
+    path = tmp_path / "chunk.mp4"
+    path.write_bytes(b"\x00\x00\x00\x18ftypmp42" + bytes(range(256)) * 16)
+    return str(path)
@@ -0,0 +1,54 @@
+import numpy as np
+
+import main
+
+
+def profile(duration: int, busy=(), scene_cuts=()) -> dict:
+    """Activity series for `duration` seconds with motion 0.5 during the busy (start, end) seconds"""
+    rate = main.Config.ACTIVITY_SAMPLE_FPS
+    motion = np.zeros(duration * rate, dtype=np.float32)
+    for start, end in busy:
+        motion[start * rate:end * rate] = 0.5
+    scene = np.zeros_like(motion)
+    for cut in scene_cuts:
+        scene[int(cut * rate)] = 1.0
+    return {"motion": motion, "foreground": np.zeros_like(motion), "scene": scene,
+            "audio": np.zeros(0, dtype=np.float32)}
+
+
+def segmenter() -> main.AdaptiveSegmenter:
+    return main.AdaptiveSegmenter(threshold=0.02, busy_seconds=5, min_seconds=3, max_seconds=30)
+
+
+def assert_covers(windows, duration):
+    assert windows[0][0] == 0 and windows[-1][1] == duration
+    assert all(previous[1] == current[0] for previous, current in zip(windows, windows[1:]))
+
+
+def test_idle_footage_gets_the_longest_windows():
+    windows = segmenter().plan(profile(75), 75)
+
+    assert windows == [(0.0, 30.0), (30.0, 60.0), (60.0, 75.0)]
+
+
+def test_activity_gets_short_windows_with_padding():
+    windows = segmenter().plan(profile(60, busy=[(20, 30)]), 60)
+
+    assert_covers(windows, 60)
+    # One second of padding on each side; the 2 s busy remainder folds into its neighbour
+    assert windows == [(0.0, 19.0), (19.0, 24.0), (24.0, 31.0), (31.0, 60.0)]
+
+
+def test_boundaries_snap_to_scene_changes():
+    windows = segmenter().plan(profile(60, busy=[(20, 30)], scene_cuts=[22.5]), 60)
+
+    assert_covers(windows, 60)
+    assert windows == [(0.0, 19.0), (19.0, 22.5), (22.5, 31.0), (31.0, 60.0)]
+
+
+def test_no_window_is_shorter_than_the_floor():
+    windows = segmenter().plan(profile(40, busy=[(10, 11), (14, 15), (30, 31)]), 40)
+
+    assert_covers(windows, 40)
+    assert all(end - start >= 3 for start, end in windows)
+    assert all(end - start <= 30 for start, end in windows)
@@ -0,0 +1,98 @@
+import threading
+import time
+from concurrent.futures import Future
+
+import main
+
+
+def wait_until(condition, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def blocked_scheduler(workers: int = 1):
+    """A scheduler whose workers are all busy until the returned event is set"""
+    scheduler = main.AlertScheduler(workers)
+    gate = threading.Event()
+    for index in range(workers):
+        scheduler.submit(f"gate-{index}", gate.wait, priority=100)
+    wait_until(lambda: scheduler.stats()["running"] == workers)
+    return scheduler, gate
+
+
+def test_jobs_run_by_priority_then_round_robin():
+    scheduler, gate = blocked_scheduler()
+    ran = []
+    for order in range(3):
+        scheduler.submit("a", lambda order=order: ran.append(("a", order)), order=order)
+        scheduler.submit("b", lambda order=order: ran.append(("b", order)), order=order)
+    scheduler.submit("urgent", lambda: ran.append(("urgent", 0)), priority=5)
+
+    gate.set()
+    wait_until(lambda: len(ran) == 7)
+
+    assert ran == [("urgent", 0), ("a", 0), ("b", 0), ("a", 1), ("b", 1), ("a", 2), ("b", 2)]
+
+
+def test_alert_never_exceeds_its_parallelism():
+    scheduler = main.AlertScheduler(6)
+    lock = threading.Lock()
+    running, peak, done = [0], [0], []
+
+    def job():
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.02)
+        with lock:
+            running[0] -= 1
+        done.append(1)
+
+    for order in range(10):
+        scheduler.submit("a", job, order=order, parallelism=2)
+    wait_until(lambda: len(done) == 10)
+
+    assert peak[0] == 2
+
+
+def test_job_returning_a_future_keeps_its_slot_but_frees_the_worker():
+    scheduler = main.AlertScheduler(1)
+    pending = []
+
+    def job():
+        future = Future()
+        pending.append(future)
+        return future
+
+    for order in range(3):
+        scheduler.submit("a", job, order=order, parallelism=2)
+    other = threading.Event()
+    scheduler.submit("b", other.set)
+
+    # The single worker moved on to "b" while "a" holds both of its slots
+    assert other.wait(5)
+    wait_until(lambda: len(pending) == 2)
+    time.sleep(0.05)
+    assert len(pending) == 2
+
+    pending[0].set_result(None)
+    wait_until(lambda: len(pending) == 3)
+
+
+def test_queue_position_counts_jobs_of_other_alerts_ahead():
+    scheduler, gate = blocked_scheduler()
+    for order in range(3):
+        scheduler.submit("low", lambda: None, order=order)
+    for order in range(2):
+        scheduler.submit("high", lambda: None, order=order, priority=1)
+
+    assert scheduler.queue_position("high") == 0
+    assert scheduler.queue_position("low") == 2
+    assert scheduler.queue_position("unknown") is None
+
+    scheduler.cancel("high")
+    assert scheduler.queue_position("low") == 0
+    gate.set()
+    wait_until(lambda: scheduler.queue_position("low") is None)
@@ -0,0 +1,85 @@
+import time
+import uuid
+from datetime import datetime
+
+import pytest
+
+import main
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    # Only explicit flushes (or a full batch) write, so tests see exactly when rows land
+    monkeypatch.setattr(main.Config, "ALERT_STORE_FLUSH_INTERVAL", 3600)
+    return str(tmp_path / "alerts.db")
+
+
+def new_alert(**fields) -> main.RealTimeAlert:
+    return main.RealTimeAlert(id=str(uuid.uuid4()), video_id="9", alert_description="a person",
+                              created_at=datetime.now(), **fields)
+
+
+def detection(detected: bool = False) -> dict:
+    return {"id": str(uuid.uuid4()), "detected": detected, "confidence": 0.9 if detected else 0.1}
+
+
+def stored_rows(store: main.AlertStore) -> int:
+    return store.db.execute("SELECT COUNT(*) FROM detections").fetchone()[0]
+
+
+def test_detections_are_written_in_batches(db_path, monkeypatch):
+    monkeypatch.setattr(main.Config, "ALERT_STORE_BATCH", 5)
+    store = main.AlertStore(db_path)
+    alert = new_alert()
+    store.add_alert(alert)
+
+    for index in range(3):
+        store.add_detection(alert.id, index, index * 10, index * 10 + 10, detection())
+    assert stored_rows(store) == 0
+
+    # A full batch wakes the writer
+    for index in range(3, 5):
+        store.add_detection(alert.id, index, index * 10, index * 10 + 10, detection())
+    deadline = time.monotonic() + 5
+    while stored_rows(store) < 5:
+        assert time.monotonic() < deadline, "writer never flushed the full batch"
+        time.sleep(0.01)
+
+    store.add_detection(alert.id, 5, 50, 60, detection(True))
+    assert [d["detected"] for d in store.detections(alert.id)] == [False] * 5 + [True]
+
+
+def test_progress_survives_a_restart(db_path):
+    store = main.AlertStore(db_path)
+    running, finished = new_alert(), new_alert()
+    store.add_alert(running)
+    store.add_alert(finished)
+    store.add_detection(running.id, 0, 0, 10, detection())
+    store.set_progress(running.id, 1)
+    store.set_progress(running.id, 3, triggered=True)
+    store.set_progress(running.id, 2)  # A late write never moves the resume point back
+    store.set_completed(finished.id)
+    store.flush()
+
+    reopened = main.AlertStore(db_path)
+    unfinished = reopened.unfinished()
+
+    assert [state["alert"].id for state in unfinished] == [running.id]
+    assert unfinished[0]["next_chunk"] == 3
+    assert unfinished[0]["triggered"]
+    assert reopened.detection_count(running.id) == 1
+
+
+def test_chunk_owners_follow_the_run_that_cut_the_chunks(db_path):
+    store = main.AlertStore(db_path)
+    leader, member = new_alert(), new_alert()
+    store.add_alert(leader)
+    store.add_alert(member)
+    store.add_detection(leader.id, 0, 0, 10, detection())
+    store.add_detection(member.id, 0, 0, 10, detection(), chunk_owner=leader.id)
+
+    assert store.chunk_owners(member.id) == {leader.id}
+    store.delete_alert(leader.id)
+    assert store.chunks_in_use(leader.id)
+    store.delete_alert(member.id)
+    assert not store.chunks_in_use(leader.id)
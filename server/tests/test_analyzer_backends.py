@@ -0,0 +1,61 @@
+import json
+
+import pytest
+
+import main
+
+MODEL = "test-model"
+
+
+def never_built():
+    raise AssertionError("offline backends never build Gemini contents")
+
+
+def test_stub_answers_are_deterministic(media_file):
+    stub = main.StubBackend(latency=0, jitter=0, detection_rate=0.5)
+
+    first = stub.generate(MODEL, [media_file], "Is there a person?", None, never_built)
+    again = stub.generate(MODEL, [media_file], "Is there a person?", None, never_built)
+    other = stub.generate(MODEL, [media_file], "Is there a car?", None, never_built)
+
+    assert first == again
+    assert json.loads(first)["answer"] != json.loads(other)["answer"]
+    assert stub.calls == 3
+
+
+def test_stub_keys_batched_answers(media_file):
+    stub = main.StubBackend(latency=0, jitter=0, detection_rate=1.0)
+
+    answer = json.loads(stub.generate(MODEL, [media_file], "conditions", None, never_built, ["a", "b"]))
+
+    assert set(answer) == {"a", "b"}
+    assert all(verdict["detected"] and verdict["confidence"] >= 0.75 for verdict in answer.values())
+
+
+def test_replay_reproduces_a_recording(media_file, tmp_path):
+    directory = str(tmp_path / "recordings")
+    recorder = main.RecordReplayBackend("record", directory, main.StubBackend(0, 0, 0.5))
+    recorded = [recorder.generate(MODEL, [media_file], f"question {n}", None, never_built) for n in range(3)]
+
+    replayer = main.RecordReplayBackend("replay", directory)
+    replayed = [replayer.generate(MODEL, [media_file], f"question {n}", None, never_built) for n in range(3)]
+
+    assert replayed == recorded
+    assert recorder.stats()["recorded"] == 3
+    assert replayer.stats()["hits"] == 3
+
+
+def test_replay_refuses_unrecorded_requests(media_file, tmp_path):
+    replayer = main.RecordReplayBackend("replay", str(tmp_path / "empty"))
+
+    with pytest.raises(LookupError):
+        replayer.generate(MODEL, [media_file], "never asked", None, never_built)
+    assert replayer.misses == 1
+
+
+def test_backends_must_implement_generate():
+    class Incomplete(main.AnalyzerBackend):
+        pass
+
+    with pytest.raises(TypeError):
+        Incomplete()
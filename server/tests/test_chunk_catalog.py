@@ -0,0 +1,51 @@
+from pathlib import Path
+
+import pytest
+
+import main
+from conftest import chunk_name
+
+BASE = 1_700_000_000
+
+
+@pytest.fixture
+def catalog(tmp_path, monkeypatch):
+    """A catalog of four 10 s chunks, 0-10, 10-20, 30-40 and 40-50 s after BASE; the last one unreadable"""
+    monkeypatch.setattr(main.ChunkCatalog, "_probe", staticmethod(
+        lambda path: {"duration": 10.0, "fps": 25.0, "codec": "avc1", "readable": "broken" not in Path(path).parts}))
+    catalog = main.ChunkCatalog(str(tmp_path / "catalog.db"))
+    for offset in (0, 10, 30):
+        path = tmp_path / chunk_name(BASE + offset)
+        path.write_bytes(b"x")
+        catalog.add("cam", str(path))
+    broken = tmp_path / "broken"
+    broken.mkdir()
+    (broken / chunk_name(BASE + 40)).write_bytes(b"x")
+    catalog.add("cam", str(broken / chunk_name(BASE + 40)))
+    return catalog
+
+
+def test_nearest_returns_the_chunk_containing_the_time(catalog):
+    assert catalog.nearest("cam", BASE + 15)["start_time"] == BASE + 10
+
+
+def test_nearest_falls_back_to_the_closest_chunk(catalog):
+    assert catalog.nearest("cam", BASE + 22)["start_time"] == BASE + 10
+    assert catalog.nearest("cam", BASE + 28)["start_time"] == BASE + 30
+    assert catalog.nearest("cam", BASE - 100)["start_time"] == BASE
+    assert catalog.nearest("cam", BASE + 500)["start_time"] == BASE + 40
+    assert catalog.nearest("other", BASE) is None
+
+
+def test_latest_skips_unreadable_chunks(catalog):
+    assert catalog.latest("cam")["start_time"] == BASE + 30
+    assert catalog.latest("other") is None
+
+
+def test_remove_and_set_activity_find_entries_by_path(catalog):
+    entry = catalog.nearest("cam", BASE + 15)
+    catalog.set_activity("cam", entry["path"], {"activity": 0.5})
+    assert catalog.nearest("cam", BASE + 15)["activity"] == 0.5
+
+    catalog.remove("cam", entry["path"])
+    assert [e["start_time"] - BASE for e in catalog.list("cam")] == [40, 30, 0]
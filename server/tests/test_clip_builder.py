@@ -0,0 +1,69 @@
+from datetime import datetime
+
+import pytest
+from fastapi import HTTPException
+
+import main
+from conftest import chunk_name
+
+BASE = 1_700_000_000
+
+
+def request(**fields) -> main.AskRequest:
+    return main.AskRequest(question="What happened?", stream="cam", **fields)
+
+
+def iso(offset: float) -> str:
+    return datetime.fromtimestamp(BASE + offset).isoformat()
+
+
+@pytest.fixture
+def builder(tmp_path, monkeypatch):
+    """A clip builder over one 10 s chunk of stream "cam" starting at BASE"""
+    monkeypatch.setattr(main.ChunkCatalog, "_probe", staticmethod(
+        lambda path: {"duration": 10.0, "fps": 25.0, "codec": "avc1", "readable": True}))
+    catalog = main.ChunkCatalog(str(tmp_path / "catalog.db"))
+    chunk = tmp_path / chunk_name(BASE)
+    chunk.write_bytes(b"x")
+    catalog.add("cam", str(chunk))
+    monkeypatch.setattr(main, "chunk_catalog", catalog)
+    monkeypatch.setattr(main.Config, "HLS_ENABLED", False)
+    return main.ClipBuilder(str(tmp_path / "clips"))
+
+
+def test_whole_chunk_requests_have_no_range(builder):
+    assert builder.resolve(request()) is None
+    assert builder.resolve(request(time="20240101_120000")) is None
+
+
+def test_start_and_end(builder):
+    assert builder.resolve(request(start=iso(2), end=iso(7))) == (BASE + 2, BASE + 7)
+
+
+def test_one_bound_covers_the_default_length(builder):
+    length = main.Config.CLIP_DEFAULT_SECONDS
+    assert builder.resolve(request(start=iso(0))) == (BASE, BASE + length)
+    assert builder.resolve(request(end=iso(0))) == (BASE - length, BASE)
+
+
+def test_last_seconds_counts_back_from_the_newest_footage(builder):
+    # last_seconds wins over start/end
+    assert builder.resolve(request(last_seconds=4, start=iso(0), end=iso(1))) == (BASE + 6, BASE + 10)
+
+
+@pytest.mark.parametrize("fields, status", [
+    ({"start": iso(5), "end": iso(5)}, 400),
+    ({"start": iso(0), "end": iso(main.Config.CLIP_MAX_SECONDS + 1)}, 400),
+    ({"start": "yesterday"}, 400),
+    ({"last_seconds": 0}, 400),
+])
+def test_invalid_ranges_are_rejected(builder, fields, status):
+    with pytest.raises(HTTPException) as error:
+        builder.resolve(request(**fields))
+    assert error.value.status_code == status
+
+
+def test_last_seconds_without_footage(builder):
+    with pytest.raises(HTTPException) as error:
+        builder.resolve(main.AskRequest(question="?", stream="empty", last_seconds=5))
+    assert error.value.status_code == 404
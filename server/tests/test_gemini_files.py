@@ -0,0 +1,64 @@
+import shutil
+from datetime import datetime, timedelta, timezone
+
+from google.genai import types
+
+import main
+
+
+class FakeFilesAPI:
+    """Stands in for client.files: every upload gets a new remote name"""
+
+    def __init__(self, lifetime: timedelta = timedelta(hours=48), fail: bool = False):
+        self.lifetime = lifetime
+        self.fail = fail
+        self.uploaded = []
+
+    def upload(self, file, config):
+        if self.fail:
+            raise ConnectionError("upload refused")
+        self.uploaded.append(file)
+        name = f"files/{len(self.uploaded)}"
+        return types.File(name=name, uri=f"https://example.invalid/{name}", mime_type=config.mime_type,
+                          state="ACTIVE", expiration_time=datetime.now(timezone.utc) + self.lifetime)
+
+    def get(self, name):
+        raise AssertionError("an ACTIVE file is never polled")
+
+
+def test_same_content_is_uploaded_once(media_file, tmp_path):
+    api = FakeFilesAPI()
+    files = main.GeminiFileManager(api)
+    copy = str(tmp_path / "renamed.mp4")
+    shutil.copy(media_file, copy)
+
+    first = files.get_file(media_file, "video/mp4")
+    second = files.get_file(copy, "video/mp4")
+
+    assert first is second
+    assert api.uploaded == [media_file]
+    assert files.stats() == {"uploads": 1, "reuses": 1, "files": 1}
+
+
+def test_expiring_file_is_uploaded_again(media_file):
+    api = FakeFilesAPI(lifetime=timedelta(seconds=main.Config.GEMINI_FILE_EXPIRY_MARGIN / 2))
+    files = main.GeminiFileManager(api)
+
+    first = files.get_file(media_file, "video/mp4")
+    second = files.get_file(media_file, "video/mp4")
+
+    assert first.name != second.name
+    assert len(api.uploaded) == 2
+    assert files.reuses == 0
+
+
+def test_failed_upload_falls_back_to_inline(media_file, monkeypatch):
+    monkeypatch.setattr(main.Config, "GEMINI_UPLOAD_MODE", "files")
+    monkeypatch.setattr(main, "gemini_files", main.GeminiFileManager(FakeFilesAPI(fail=True)))
+
+    contents = main.gemini_analyzer._create_content(video_path=media_file, question="What happens?")
+
+    video = contents[0].parts[0]
+    assert video.file_data is None
+    with open(media_file, "rb") as f:
+        assert video.inline_data.data == f.read()